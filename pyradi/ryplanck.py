@@ -43,7 +43,8 @@ If the spectral variable and temperature are both single numbers (scalars or lis
 with one element), the return value is a scalar.  If either the temperature or the
 spectral variable are single-valued, the return value is a rank-1 vector. If both
 the temperature and spectral variable are multi-valued, the return value is a 
-rank-2 array, with the spectral variable along axis=0.
+rank-2 array, with the spectral variable along axis=0.  The planckel_arr 
+function always returns the rank-2 (N,M) array, irrespective of input sizes.
 
 This module uses the CODATA physical constants. For more details see
 http://physics.nist.gov/cuu/pdf/RevModPhysCODATA2010.pdf
@@ -63,16 +64,45 @@ PM236, SPIE Press, 2013.  http://spie.org/x648.html?product_id=2021423&origin_id
 __version__= "$Revision$"
 __author__='pyradi team'
 __all__=['planck','dplanck','stefanboltzman','planckef',  'planckel', 'plancken',
-'planckqf', 'planckql', 'planckqn', 'dplnckef', 'dplnckel', 'dplncken', 'dplnckqf',
+'planckqf', 'planckql', 'planckqn', 'planckel_arr', 'dplnckef', 'dplnckel', 'dplncken', 'dplnckqf',
 'dplnckql', 'dplnckqn','an','printConstants','planckInt']
 
+import os
 import sys
+import math
+import threading
 import numpy as np
 import scipy.constants as const
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 
 #np.exp() has upper limit in IEEE double range, catch this in Planck calcs
-explimit = 709.7
+#just below log(max double) = 709.7827, where exp overflows to infinity
+explimit = 709.78
+#and similarly for IEEE single range, used with dtype=np.float32
+explimit32 = 88.72
+
+#grid size (N*M) above which the numba and numpy evaluation is threaded
+threadlimit = 250000
+
+# numexpr evaluates the Planck expressions in a single fused pass over the
+# (N,M) grid, without the intermediate temporary arrays required by numpy
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+# numba compiles the Planck expressions into (parallel) loops over the grid
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# cupy evaluates the Planck expressions on the GPU, for cupy array inputs
+try:
+    import cupy
+except ImportError:
+    cupy = None
 
 
 import pyradi.ryutils as ryutils
@@ -96,8 +126,6 @@ class PlanckConstants:
         Reference: http://www.spectralcalc.com/blackbody/appendixC.html
         """
 
-        import scipy.optimize
-
         self.c1em = 2 * np.pi * const.h * const.c * const.c
         self.c1el = self.c1em * (1.0e6)**(5-1) # 5 for lambda power and -1 for density
         self.c1en = self.c1em * (100)**3 * 100 # 3 for wavenumber, 1 for density
@@ -118,10 +146,12 @@ class PlanckConstants:
         self.sigmaq = 4 * np.pi * self.zeta3 * const.k ** 3 \
                / (const.h ** 3 * const.c ** 2)
 
-        self.a2 = scipy.optimize.brentq(self.an, 1, 2, (2) )
-        self.a3 = scipy.optimize.brentq(self.an, 2, 3, (3) )
-        self.a4 = scipy.optimize.brentq(self.an, 3.5, 4, (4) )
-        self.a5 = scipy.optimize.brentq(self.an, 4.5, 5, (5) )
+        # roots of an(x,n) = n(1-exp(-x))-x, these are mathematical constants
+        # and need not be solved (scipy.optimize.brentq) on every import
+        self.a2 = 1.5936242600400401
+        self.a3 = 2.8214393721220788
+        self.a4 = 3.9206903948728864
+        self.a5 = 4.9651142317442763
 
         self.wel = 1e6 * const.h * const.c /(const.k * self.a5)
         self.wql = 1e6 * const.h * const.c /(const.k * self.a4)
@@ -132,6 +162,9 @@ class PlanckConstants:
 
 
     def an(self,x,n):
+        """Function n(1-exp(-x))-x, with roots a2, a3, a4 and a5 used in the
+        Wien displacement law, e.g. scipy.optimize.brentq(pconst.an, 4.5, 5, (5)).
+        """
         return n * (1-np.exp(-x)) - x
 
     def printConstants(self):
@@ -191,67 +224,367 @@ class PlanckConstants:
 pconst = PlanckConstants()
 
 
+################################################################
+##
+if numba is not None:
+    # fast-math flags, excluding nnan and ninf: zero temperature gives an
+    # infinite exponent, which must still compare correctly against explimit.
+    # reassoc and arcp are also excluded, these regroup the divisions by 
+    # expm1(x) in the derivative into products which overflow.
+    # The inner loops run over contiguous 1-D arrays, with scalar exp/expm1
+    # calls; the explimit test and _expm1 are data-dependent branches, which
+    # measured no slower than branchless select forms, as exp calls dominate.
+    _fastmath = {'nsz', 'contract', 'afn'}
+
+    @numba.njit(fastmath=_fastmath, inline='always', cache=True)
+    def _expm1(x):
+        """expm1(x), with the faster exp(x)-1 for x>1, where the subtraction
+        loses less than one bit of precision.
+        """
+        return math.exp(x) - 1.0 if x > 1.0 else math.expm1(x)
+
+    # explicit double and single precision signatures compile the kernels 
+    # eagerly, and with cache=True these are loaded from __pycache__ on later
+    # imports, so that the first Planck call does not pay the JIT compile time
+    _planckSigs = ['void(f8[::1], f8[::1], f8[::1], f8, f8[:, ::1])',
+                   'void(f4[::1], f4[::1], f4[::1], f4, f4[:, ::1])']
+    _dplanckSigs = ['void(f8[::1], f8[::1], f8[::1], f8, f8[:, ::1])',
+                    'void(f4[::1], f4[::1], f4[::1], f4, f4[:, ::1])']
+
+    @numba.njit(fastmath=_fastmath, error_model='numpy', inline='always',
+                cache=True)
+    def _planckRow(a, b, rtemp, lim, out):
+        """Numba row of the Planck grid, out[j] = a / (exp(b * rtemp[j]) - 1),
+        with spectral factors a and b, and reciprocal temperature rtemp.
+        """
+        for j in range(rtemp.shape[0]):
+            x = b * rtemp[j]
+            #if exponent is x>=lim, force Planck to zero
+            out[j] = 0.0 if x >= lim else a / _expm1(x)
+
+    @numba.njit(fastmath=_fastmath, error_model='numpy', inline='always',
+                cache=True)
+    def _dplanckRow(a, b, rtemp, lim, out):
+        """Numba row of the temperature derivative of _planckRow,
+        x exp(x) a / (t (exp(x) - 1)^2) = (a / em) (x / t) (1 + 1 / em)
+        with x = b * rtemp[j] and em = exp(x) - 1.
+        """
+        for j in range(rtemp.shape[0]):
+            x = b * rtemp[j]
+            #if exponent is x>=lim, force the derivative to zero
+            if x >= lim:
+                out[j] = 0.0
+            else:
+                em = _expm1(x)
+                z = (a / em) * x * rtemp[j]
+                out[j] = z + z / em
+
+    # serial kernels are used for grids up to threadlimit, and the parallel
+    # kernels above that.  Calls from several Python threads into parallel
+    # kernels abort the process with numba's workqueue threading layer (the
+    # fallback without TBB or OpenMP), so the parallel launches are serialised.
+    # The numpy error model gives inf/nan for divisions by zero, such as 0/0
+    # at zero wavenumber, as numpy does, instead of raising ZeroDivisionError.
+    @numba.njit(_planckSigs, fastmath=_fastmath, error_model='numpy',
+                boundscheck=False, cache=True)
+    def _planckKernel(a, b, rtemp, lim, out):
+        """Numba kernel for out[i,j] = a[i] / (exp(b[i] * rtemp[j]) - 1).
+        """
+        for i in range(a.shape[0]):
+            _planckRow(a[i], b[i], rtemp, lim, out[i])
+
+    @numba.njit(_planckSigs, parallel=True, fastmath=_fastmath, 
+                error_model='numpy', boundscheck=False, cache=True)
+    def _planckKernelPar(a, b, rtemp, lim, out):
+        """Numba kernel _planckKernel, parallel over the spectral rows.
+        """
+        for i in numba.prange(a.shape[0]):
+            _planckRow(a[i], b[i], rtemp, lim, out[i])
+
+    @numba.njit(_dplanckSigs, fastmath=_fastmath, error_model='numpy',
+                boundscheck=False, cache=True)
+    def _dplanckKernel(a, b, rtemp, lim, out):
+        """Numba kernel for the temperature derivative of _planckKernel.
+        """
+        for i in range(a.shape[0]):
+            _dplanckRow(a[i], b[i], rtemp, lim, out[i])
+
+    @numba.njit(_dplanckSigs, parallel=True, fastmath=_fastmath, 
+                error_model='numpy', boundscheck=False, cache=True)
+    def _dplanckKernelPar(a, b, rtemp, lim, out):
+        """Numba kernel _dplanckKernel, parallel over the spectral rows.
+        """
+        for i in numba.prange(a.shape[0]):
+            _dplanckRow(a[i], b[i], rtemp, lim, out[i])
+
+    _parallelLock = threading.Lock()
+
+
+def _planckJit(a, b, rtemp, lim):
+    """Evaluate the Planck law a / (exp(b / t) - 1) with the numba kernel, 
+    for spectral factors a, b with shape (N,1) and reciprocal temperature
+    rtemp with shape (1,M).
+    """
+    out = np.empty((a.shape[0], rtemp.shape[1]), dtype=a.dtype)
+    args = (a.ravel(), b.ravel(), rtemp.ravel(), lim, out)
+    if out.size <= threadlimit:
+        _planckKernel(*args)
+    else:
+        with _parallelLock:
+            _planckKernelPar(*args)
+    return out
+
+
+def _dplanckJit(a, b, rtemp, lim):
+    """Evaluate the temperature derivative of the Planck law with the numba 
+    kernel, for spectral factors a, b with shape (N,1) and reciprocal 
+    temperature rtemp with shape (1,M).
+    """
+    out = np.empty((a.shape[0], rtemp.shape[1]), dtype=a.dtype)
+    args = (a.ravel(), b.ravel(), rtemp.ravel(), lim, out)
+    if out.size <= threadlimit:
+        _dplanckKernel(*args)
+    else:
+        with _parallelLock:
+            _dplanckKernelPar(*args)
+    return out
+
+
+################################################################
+##
+def _arrayModule(*arrays):
+    """Return the cupy module if any of the arrays is a cupy array, 
+    otherwise the numpy module.
+    """
+    return np if cupy is None else cupy.get_array_module(*arrays)
+
+
+################################################################
+##
+def _threadedColumns(fun, numRows, *temperatures):
+    """Evaluate fun over chunks of the temperature columns in a thread pool.
+
+    numpy releases the GIL in its ufuncs, so large grids are split into 
+    one chunk of temperature columns per cpu and the (N,Mi) results are 
+    joined along the temperature axis.  Small grids are evaluated directly.
+
+    Args:
+        | fun (function):  function of the temperature arrays, returning (N,Mi)
+        | numRows (int):  number of spectral rows N in the grid
+        | temperatures (np.array (1,M)):  temperature dependent arrays
+
+    Returns:
+        | (np.array[N,M]):  fun evaluated over all temperature columns
+
+    Raises:
+        | No exception is raised.
+    """
+    numCols = temperatures[0].shape[1]
+    numChunks = min(os.cpu_count() or 1, numCols)
+    if numChunks < 2 or numRows * numCols <= threadlimit:
+        return fun(*temperatures)
+
+    edges = np.linspace(0, numCols, numChunks + 1).astype(int)
+    with ThreadPoolExecutor(max_workers=numChunks) as pool:
+        parts = pool.map(lambda i: fun(*[t[:, edges[i]:edges[i+1]]
+            for t in temperatures]), range(numChunks))
+        return np.concatenate(list(parts), axis=1)
+
+
+################################################################
+##
+def _planckGrid(a, b, temperature, dtype):
+    """Evaluate the Planck law a / (exp(b / t) - 1) on the (N,M) grid.
+
+    All the Planck functions have this form, with spectral-only factors
+    a = c1 s^k and b = c2 s^(+-1) calculated in double precision by the 
+    caller.  The grid is evaluated with numba, numexpr or numpy, in this
+    order of preference, depending on which is installed, with large numpy
+    grids split over threads.  Cupy arrays are evaluated on the GPU with cupy.
+
+    Args:
+        | a (np.array (N,1)):  spectral factor c1 s^k
+        | b (np.array (N,1)):  spectral factor c2 s^(+-1) of the exponent
+        | temperature (np.array (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 or np.float32
+
+    Returns:
+        | (np.array[N,M]):  spectral exitance
+
+    Raises:
+        | No exception is raised.
+    """
+    a = a.astype(dtype, copy=False)
+    b = b.astype(dtype, copy=False)
+    #the zero temperature substitute 1e-300 overflows to inf in single precision
+    with np.errstate(over='ignore'):
+        rt = (1.0 / temperature).astype(dtype, copy=False)
+    lim = dtype.type(explimit if dtype == np.float64 else explimit32)
+    xp = _arrayModule(a, rt)
+
+    if numba is not None and xp is np:
+        return _planckJit(a, b, rt, lim)
+
+    # the Planck value is selected as zero where the exponent x>=lim, also
+    # where a and b are infinite at zero wavelength, where a/expm1(x) is nan
+    if ne is not None and xp is np:
+        return ne.evaluate('where(b*rt>=lim, 0, a/expm1(b*rt))',
+            local_dict={'a':a, 'b':b, 'rt':rt, 'lim':lim})
+
+    def planckCols(rt):
+        #clip the exponent to prevent infinity
+        #this happens for low temperatures and short wavelengths
+        exP = b * rt
+        p = xp.minimum(exP, lim)
+        xp.expm1(p, out=p)
+        xp.divide(a, p, out=p)
+        #if exponent is exP>=lim, force Planck to zero
+        p[exP >= lim] = 0
+        return p
+
+    if xp is not np:
+        return planckCols(rt)
+
+    return _threadedColumns(planckCols, a.shape[0], rt)
+
+
+################################################################
+##
+def _dplanckGrid(a, b, temperature, dtype):
+    """Evaluate the temperature derivative of the Planck law a / (exp(b / t) - 1)
+    on the (N,M) grid, see _planckGrid.
+
+    Args:
+        | a (np.array (N,1)):  spectral factor c1 s^k
+        | b (np.array (N,1)):  spectral factor c2 s^(+-1) of the exponent
+        | temperature (np.array (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 or np.float32
+
+    Returns:
+        | (np.array[N,M]):  spectral exitance temperature derivative
+
+    Raises:
+        | No exception is raised.
+    """
+    # a*x*exp(x)/(t*(exp(x)-1)**2) with x=b/t refactored as 
+    # (a/expm1(x))*(x/t)*(1+1/expm1(x)), to prevent overflow problem:
+    # a is divided by expm1(x) before the other factors are applied, so that
+    # no intermediate exceeds the result, also not a*b in single precision.
+    # expm1(x) is evaluated once per grid point and reused in all paths,
+    # numexpr does not share subexpressions, hence the two passes there.
+    a = a.astype(dtype, copy=False)
+    b = b.astype(dtype, copy=False)
+    #the zero temperature substitute 1e-300 overflows to inf in single precision
+    with np.errstate(over='ignore'):
+        rt = (1.0 / temperature).astype(dtype, copy=False)
+    lim = dtype.type(explimit if dtype == np.float64 else explimit32)
+    xp = _arrayModule(a, rt)
+
+    if numba is not None and xp is np:
+        return _dplanckJit(a, b, rt, lim)
+
+    # zero where the exponent x>=lim, as in _planckGrid
+    if ne is not None and xp is np:
+        em = ne.evaluate('expm1(b*rt)', local_dict={'b':b, 'rt':rt})
+        return ne.evaluate('where(b*rt>=lim, 0, (a/em) * (b*rt) * rt * (1+1/em))',
+            local_dict={'a':a, 'b':b, 'rt':rt, 'em':em, 'lim':lim})
+
+    def dplanckCols(rt):
+        #evaluated in place in two grid buffers, to limit temporary arrays
+        dp = b * rt
+        zero = dp >= lim
+        em = xp.minimum(dp, lim)
+        xp.expm1(em, out=em)
+        #overflow only where the exponent x>=lim, which is set to zero
+        with np.errstate(over='ignore'):
+            dp /= em
+            dp *= a
+            dp *= rt
+        xp.reciprocal(em, out=em)
+        em += 1
+        dp *= em
+        dp[zero] = 0
+        return dp
+
+    if xp is not np:
+        return dplanckCols(rt)
+
+    return _threadedColumns(dplanckCols, a.shape[0], rt)
+
+
+################################################################
+##
+def _planckArray(planckFun, spectral, temperature, dtype=None):
+  """Prepare the spectral and temperature array dimensions and order, and
+  evaluate the Planck function on the (N,M) grid.
+  The Planck functions process elementwise, using numpy broadcasting.
+  The spectral variable is shaped as a column (N,1) and the temperature 
+  as a row (1,M), so that the planck function directly returns the C 
+  contiguous (N,M) result without building meshgrid copies or transposes.
+  The dtype (np.float64 or np.float32) sets the precision of the calculation.
+  If either input is a cupy array, the calculation is done with cupy and
+  a cupy array is returned.
+  """
+  xp = _arrayModule(spectral, temperature)
+
+  #confirm that only vector is used, break with warning if so.
+  if isinstance(temperature, xp.ndarray):
+      if temperature.size != max(temperature.shape):
+          print('ryplanck: temperature must be of shape (M,), (M,1) or (1,M)')
+          return None
+  #confirm that no row vector is used, break with warning if so.
+  if isinstance(spectral, xp.ndarray):
+      if spectral.size != spectral.shape[0]:
+          print('ryplanck: spectral must be of shape (N,) or (N,1)')
+          return None
+  #confirm that the precision is supported, break with warning if not.
+  dtype = np.dtype(np.float64 if dtype is None else dtype)
+  if dtype not in (np.float64, np.float32):
+      print('ryplanck: dtype must be np.float64 or np.float32')
+      return None
+  #spectral along axis=0 and temperature along axis=1, broadcast to (N,M)
+  #converted once to float64, float64 array inputs are used without copies
+  spec = xp.asarray(spectral, dtype=np.float64).reshape(-1,1)
+  temp = xp.asarray(temperature, dtype=np.float64).reshape(1,-1)
+
+  #test for zero temperature
+  temp = xp.where(temp!=0.0, temp, 1e-300);
+
+  #this is the actual planck calculation, result has shape (N,M)
+  return xp.ascontiguousarray(planckFun(spec,temp,dtype))
+
+
 ################################################################
 ##
 def fixDimensions(planckFun):
   """Decorator function to prepare the spectral and temperature array 
-  dimensions and order before and after the actual Planck function.
-  The Planck functions process elementwise and therefore require 
-  flattened arrays.  This decorator flattens, executes the planck function
-  and reshape afterwards the correct shape, according to input.
+  dimensions and order before and after the actual Planck function,
+  see _planckArray.  The (N,M) result is reshaped afterwards to the 
+  correct shape, according to input.
   """
   @wraps(planckFun)
-  def inner(spectral, temperature):
+  def inner(spectral, temperature, dtype=None):
 
-    #confirm that only vector is used, break with warning if so.
-    if isinstance(temperature, np.ndarray):
-        if len(temperature.flat) != max(temperature.shape):
-            print('ryplanck: temperature must be of shape (M,), (M,1) or (1,M)')
-            return None
-    #confirm that no row vector is used, break with warning if so.
-    if isinstance(spectral, np.ndarray):
-        if len(spectral.flat) != spectral.shape[0]:
-            print('ryplanck: spectral must be of shape (N,) or (N,1)')
-            return None
-    tempIn = np.array(temperature, copy=True,  ndmin=1).astype(float)
-    specIn = np.array(spectral, copy=True,  ndmin=1).astype(float)
-    tempIn = tempIn.reshape(-1,1)
-    specIn = specIn.reshape(-1,1)
-
-    #create flattened version of the input dataset
-    specgrid, tempgrid = np.meshgrid(specIn,tempIn)
-    spec = np.ravel(specgrid)
-    temp = np.ravel(tempgrid)
-
-    #test for zero temperature
-    temp = np.where(temp!=0.0, temp, 1e-300);
-
-    #this is the actual planck calculation
-    planckA = planckFun(spec,temp) 
-
-    #now unflatten to proper structure again, spectral along axis=0
-    if tempIn.shape[0] == 1 and specIn.shape[0] == 1:
-        rtnVal = planckA[0]
-    elif tempIn.shape[0] == 1 and specIn.shape[0] != 1:
-        rtnVal = planckA.reshape(specIn.shape[0],)
-    elif tempIn.shape[0] != 1 and specIn.shape[0] == 1:
-        rtnVal = planckA.reshape(specIn.shape[0],-1)
-    else:
-        rtnVal = planckA.reshape(tempIn.shape[0],-1).T
+    planckA = _planckArray(planckFun, spectral, temperature, dtype)
+    if planckA is None:
+        return None
 
-    return rtnVal
+    #now reduce to proper structure again, spectral along axis=0:
+    #drop single-valued axes, and unwrap the 0-d array to a scalar
+    return _arrayModule(planckA).squeeze(planckA)[()]
   return inner
 
 
 ################################################################
 ##
 @fixDimensions
-def planckel(spectral, temperature):
+def planckel(spectral, temperature, dtype=None):
     """ Planck function in wavelength for radiant exitance.
 
     Args:
         | spectral (scalar, np.array (N,) or (N,1)):  wavelength vector in  [um]
         | temperature (scalar, list[M], np.array (M,), (M,1) or (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
 
     Returns:
         | (scalar, np.array[N,M]):  spectral radiant exitance in W/(m^2.um)
@@ -262,26 +595,44 @@ def planckel(spectral, temperature):
 
     # planckA = pconst.c1el / (spec ** 5 * ( np.exp(pconst.c2l / (spec * temp))-1));
 
-    #test value of exponent to prevent infinity, force to exponent to zero
-    #this happens for low temperatures and short wavelengths
-    exP =  pconst.c2l / (spectral * temperature)
-    exP2 = np.where(exP<explimit, exP, 1);
-    p = (pconst.c1el / ( np.exp(exP2)-1)) / (spectral ** 5)
-    #if exponent is exP>=explimit, force Planck to zero
-    planckA = np.where(exP<explimit, p, 0);
+    s2 = spectral * spectral
+    return _planckGrid(pconst.c1el / (s2 * s2 * spectral), pconst.c2l / spectral,
+        temperature, dtype)
 
-    return planckA
+
+################################################################
+##
+def planckel_arr(spectral, temperature, dtype=None):
+    """ Planck function in wavelength for radiant exitance, always returned
+    as a C contiguous (N,M) array.
+
+    Unlike planckel, single-valued spectral or temperature axes are kept, 
+    so that the result shape does not depend on the input sizes.
+
+    Args:
+        | spectral (scalar, np.array (N,) or (N,1)):  wavelength vector in  [um]
+        | temperature (scalar, list[M], np.array (M,), (M,1) or (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
+
+    Returns:
+        | (np.array[N,M]):  spectral radiant exitance in W/(m^2.um)
+
+    Raises:
+        | No exception is raised, returns None on error.
+    """
+    return _planckArray(planckel.__wrapped__, spectral, temperature, dtype)
 
 
 ################################################################
 ##
 @fixDimensions
-def planckef(spectral, temperature):
+def planckef(spectral, temperature, dtype=None):
     """ Planck function in frequency for radiant exitance.
 
     Args:
         | spectral (scalar, np.array (N,) or (N,1)):  frequency vector in  [Hz]
         | temperature (scalar, list[M], np.array (M,), (M,1) or (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
 
     Returns:
         | (scalar, np.array[N,M]): spectral radiant exitance in W/(m^2.Hz)
@@ -292,27 +643,22 @@ def planckef(spectral, temperature):
 
     # planckA = pconst.c1ef * spec**3 / (np.exp(pconst.c2f * spec / temp)-1);
 
-    #test value of exponent to prevent infinity, force to exponent to zero
-    #this happens for low temperatures and short wavelengths
-    exP =  pconst.c2f * spectral / temperature
-    exP2 = np.where(exP<explimit, exP, 1);
-    p = pconst.c1ef * spectral**3 / (np.exp(exP2)-1);
-    #if exponent is exP>=explimit, force Planck to zero
-    planckA = np.where(exP<explimit, p, 0);
-
-    return planckA
+    s2 = spectral * spectral
+    return _planckGrid(pconst.c1ef * s2 * spectral, pconst.c2f * spectral,
+        temperature, dtype)
 
 
 
 ################################################################
 ##
 @fixDimensions
-def plancken(spectral, temperature):
+def plancken(spectral, temperature, dtype=None):
     """ Planck function in wavenumber for radiant exitance.
 
     Args:
         | spectral (scalar, np.array (N,) or (N,1)):  wavenumber vector in   [cm^-1]
         | temperature (scalar, list[M], np.array (M,), (M,1) or (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
 
     Returns:
         | (scalar, np.array[N,M]):  spectral radiant exitance in  W/(m^2.cm^-1)
@@ -323,26 +669,21 @@ def plancken(spectral, temperature):
 
     # planckA = pconst.c1en * spec**3 / (np.exp(pconst.c2n * (spec / temp))-1)
 
-    #test value of exponent to prevent infinity, force to exponent to zero
-    #this happens for low temperatures and short wavelengths
-    exP =  pconst.c2n * (spectral / temperature)
-    exP2 = np.where(exP<explimit, exP, 1);
-    p = ( pconst.c1en  / (np.exp(exP)-1) ) * spectral**3
-    #if exponent is exP>=explimit, force Planck to zero
-    planckA = np.where(exP<explimit, p, 0);
-
-    return planckA
+    s2 = spectral * spectral
+    return _planckGrid(pconst.c1en * s2 * spectral, pconst.c2n * spectral,
+        temperature, dtype)
 
 
 ################################################################
 ##
 @fixDimensions
-def planckqf(spectral, temperature):
+def planckqf(spectral, temperature, dtype=None):
     """ Planck function in frequency domain for photon rate exitance.
 
     Args:
         | spectral (scalar, np.array (N,) or (N,1)): frequency vector in  [Hz]
         | temperature (scalar, list[M], np.array (M,), (M,1) or (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
 
     Returns:
         | (scalar, np.array[N,M]):  spectral radiant exitance in q/(s.m^2.Hz)
@@ -351,26 +692,22 @@ def planckqf(spectral, temperature):
         | No exception is raised, returns None on error.
     """
 
-    #test value of exponent to prevent infinity, force to exponent to zero
-    #this happens for low temperatures and short wavelengths
-    exP =  pconst.c2f * spectral / temperature
-    exP2 = np.where(exP<explimit, exP, 1);
-    p = pconst.c1nf * spectral**2 / (np.exp(exP2)-1)
-    #if exponent is exP>=explimit, force Planck to zero
-    planckA = np.where(exP<explimit, p, 0);
 
-    return planckA
+    s2 = spectral * spectral
+    return _planckGrid(pconst.c1nf * s2, pconst.c2f * spectral,
+        temperature, dtype)
 
 
 ################################################################
 ##
 @fixDimensions
-def planckql(spectral, temperature):
+def planckql(spectral, temperature, dtype=None):
     """ Planck function in wavelength domain for photon rate exitance.
 
     Args:
         | spectral (scalar, np.array (N,) or (N,1)):  wavelength vector in  [um]
         | temperature (scalar, list[M], np.array (M,), (M,1) or (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
 
     Returns:
         | (scalar, np.array[N,M]):  spectral radiant exitance in  q/(s.m^2.um)
@@ -378,27 +715,23 @@ def planckql(spectral, temperature):
     Raises:
         | No exception is raised, returns None on error.
     """
-    #test value of exponent to prevent infinity, force to exponent to zero
-    #this happens for low temperatures and short wavelengths
-    exP = pconst.c2l / (spectral * temperature)
-    exP2 = np.where(exP<explimit, exP, 1);
-    # print(np.max(exP), np.max(exP2))
-    p = (pconst.c1ql /( np.exp(exP2)-1) )  / (spectral**4 )
-    #if exponent is exP>=explimit, force Planck to zero
-    planckA = np.where(exP<explimit, p, 0);
 
-    return planckA
+
+    s2 = spectral * spectral
+    return _planckGrid(pconst.c1ql / (s2 * s2), pconst.c2l / spectral,
+        temperature, dtype)
 
 
 ################################################################
 ##
 @fixDimensions
-def planckqn(spectral, temperature):
+def planckqn(spectral, temperature, dtype=None):
     """ Planck function in wavenumber domain for photon rate exitance.
 
     Args:
         | spectral (scalar, np.array (N,) or (N,1)):  wavenumber vector in   [cm^-1]
         | temperature (scalar, list[M], np.array (M,), (M,1) or (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
 
     Returns:
         | (scalar, np.array[N,M]):  spectral radiant exitance in  q/(s.m^2.cm^-1)
@@ -407,27 +740,23 @@ def planckqn(spectral, temperature):
         | No exception is raised, returns None on error.
     """
 
-    #test value of exponent to prevent infinity, force to exponent to zero
-    #this happens for low temperatures and short wavelengths
-    exP =  pconst.c2n * spectral / temperature
-    exP2 = np.where(exP<explimit, exP, 1);
-    p = pconst.c1qn * spectral**2 / (np.exp(exP2)-1);
-    #if exponent is exP>=explimit, force Planck to zero
-    planckA = np.where(exP<explimit, p, 0);
 
-    return planckA
+    s2 = spectral * spectral
+    return _planckGrid(pconst.c1qn * s2, pconst.c2n * spectral,
+        temperature, dtype)
 
 
 ################################################################
 ##
 @fixDimensions
-def dplnckef(spectral, temperature):
+def dplnckef(spectral, temperature, dtype=None):
     """Temperature derivative of Planck function in frequency domain
     for radiant exitance.
 
     Args:
         | spectral (scalar, np.array (N,) or (N,1)): frequency vector in  [Hz]
         | temperature (scalar, list[M], np.array (M,), (M,1) or (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
 
     Returns:
         | (scalar, np.array[N,M]):  spectral radiant exitance/K in W/(K.m^2.Hz)
@@ -436,25 +765,23 @@ def dplnckef(spectral, temperature):
         | No exception is raised, returns None on error.
     """
 
-    xx=(pconst.c2f * spectral /temperature);
-    f=xx*np.exp(xx)/(temperature*(np.exp(xx)-1))
-    y=pconst.c1ef * spectral**3 / (np.exp(pconst.c2f * spectral \
-            / temperature)-1);
-    dplanckA = f*y;
 
-    return dplanckA
+    s2 = spectral * spectral
+    return _dplanckGrid(pconst.c1ef * s2 * spectral, pconst.c2f * spectral,
+        temperature, dtype)
 
 
 ################################################################
 ##
 @fixDimensions
-def dplnckel(spectral, temperature):
+def dplnckel(spectral, temperature, dtype=None):
     """Temperature derivative of Planck function in wavelength domain for
     radiant exitance.
 
     Args:
         | spectral (scalar, np.array (N,) or (N,1)):  wavelength vector in  [um]
         | temperature (scalar, list[M], np.array (M,), (M,1) or (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
 
     Returns:
         | (scalar, np.array[N,M]):  spectral radiant exitance in W/(K.m^2.um)
@@ -463,26 +790,22 @@ def dplnckel(spectral, temperature):
         | No exception is raised, returns None on error.
     """
 
-    # if xx > 350, then we get overflow
-    xx = pconst.c2l /(spectral * temperature)
-    # return (3.7418301e8 * xx * np.exp(xx) ) \
-    #     / (temperature* spectral ** 5 * (np.exp(xx)-1) **2 )
-    # refactor (np.exp(xx)-1)**2 to prevent overflow problem
-    dplanckA = (pconst.c1el * xx * np.exp(xx) / (np.exp(xx)-1) ) \
-        / (temperature* spectral ** 5 * (np.exp(xx)-1) )
 
-    return dplanckA
+    s2 = spectral * spectral
+    return _dplanckGrid(pconst.c1el / (s2 * s2 * spectral), pconst.c2l / spectral,
+        temperature, dtype)
 
 
 ################################################################
 ##
 @fixDimensions
-def dplncken(spectral, temperature):
+def dplncken(spectral, temperature, dtype=None):
     """Temperature derivative of Planck function in wavenumber domain for radiance exitance.
 
     Args:
         | spectral (scalar, np.array (N,) or (N,1)):  wavenumber vector in   [cm^-1]
         | temperature (scalar, list[M], np.array (M,), (M,1) or (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
 
     Returns:
         | (scalar, np.array[N,M]):  spectral radiant exitance in  W/(K.m^2.cm^-1)
@@ -491,24 +814,22 @@ def dplncken(spectral, temperature):
         | No exception is raised, returns None on error.
     """
 
-    xx=(pconst.c2n * spectral /temperature)
-    f=xx*np.exp(xx)/(temperature*(np.exp(xx)-1))
-    y=(pconst.c1en* spectral **3 / (np.exp(pconst.c2n * spectral \
-            / temperature)-1))
-    dplanckA = f*y;
 
-    return dplanckA
+    s2 = spectral * spectral
+    return _dplanckGrid(pconst.c1en * s2 * spectral, pconst.c2n * spectral,
+        temperature, dtype)
 
 
 ################################################################
 ##
 @fixDimensions
-def dplnckqf(spectral, temperature):
+def dplnckqf(spectral, temperature, dtype=None):
     """Temperature derivative of Planck function in frequency domain for photon rate.
 
     Args:
         | spectral (scalar, np.array (N,) or (N,1)): frequency vector in  [Hz]
         | temperature (scalar, list[M], np.array (M,), (M,1) or (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
 
     Returns:
         | (scalar, np.array[N,M]):  spectral radiant exitance in q/(K.s.m^2.Hz)
@@ -517,24 +838,22 @@ def dplnckqf(spectral, temperature):
         | No exception is raised, returns None on error.
     """
 
-    xx=(pconst.c2f * spectral /temperature)
-    f=xx*np.exp(xx)/(temperature*(np.exp(xx)-1))
-    y=pconst.c1nf * spectral **2 / (np.exp(pconst.c2f * spectral \
-            / temperature)-1)
-    dplanckA = f*y;
 
-    return dplanckA
+    s2 = spectral * spectral
+    return _dplanckGrid(pconst.c1nf * s2, pconst.c2f * spectral,
+        temperature, dtype)
 
 
 ################################################################
 ##
 @fixDimensions
-def dplnckql(spectral, temperature):
+def dplnckql(spectral, temperature, dtype=None):
     """Temperature derivative of Planck function in wavenumber domain for radiance exitance.
 
     Args:
         | spectral (scalar, np.array (N,) or (N,1)):  wavelength vector in  [um]
         | temperature (scalar, list[M], np.array (M,), (M,1) or (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
 
     Returns:
         | (scalar, np.array[N,M]):  spectral radiant exitance in  q/(K.s.m^2.um)
@@ -543,24 +862,22 @@ def dplnckql(spectral, temperature):
         | No exception is raised, returns None on error.
     """
 
-    xx=(pconst.c2l /(spectral * temperature))
-    f=xx*np.exp(xx)/(temperature*(np.exp(xx)-1))
-    y=pconst.c1ql / (spectral ** 4 * ( np.exp(pconst.c2l \
-            / (temperature * spectral))-1))
-    dplanckA = f*y;
 
-    return dplanckA
+    s2 = spectral * spectral
+    return _dplanckGrid(pconst.c1ql / (s2 * s2), pconst.c2l / spectral,
+        temperature, dtype)
 
 
 ################################################################
 ##
 @fixDimensions
-def dplnckqn(spectral, temperature):
+def dplnckqn(spectral, temperature, dtype=None):
     """Temperature derivative of Planck function in wavenumber domain for photon rate.
 
     Args:
         | spectral (scalar, np.array (N,) or (N,1)):  wavenumber vector in   [cm^-1]
         | temperature (scalar, list[M], np.array (M,), (M,1) or (1,M)):  Temperature in [K]
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
 
     Returns:
         | (scalar, np.array[N,M]):  spectral radiant exitance in  q/(s.m^2.cm^-1)
@@ -569,13 +886,10 @@ def dplnckqn(spectral, temperature):
         | No exception is raised, returns None on error.
     """
 
-    xx=(pconst.c2n * spectral /temperature)
-    f=xx*np.exp(xx)/(temperature*(np.exp(xx)-1))
-    y=pconst.c1qn * spectral **2 / (np.exp(pconst.c2n * spectral \
-            / temperature)-1)
-    dplanckA = f*y;
 
-    return dplanckA
+    s2 = spectral * spectral
+    return _dplanckGrid(pconst.c1qn * s2, pconst.c2n * spectral,
+        temperature, dtype)
 
 
 ################################################################
@@ -606,11 +920,12 @@ def stefanboltzman(temperature, type='e'):
             return -1
 
     tempr = np.asarray(temperature).astype(float)
-    #use dictionary to switch between options, lambda fn to calculate, default -1
-    rtnval = {
-              'e': lambda temp: pconst.sigmae * np.power(temp, 4) ,
-              'q': lambda temp: pconst.sigmaq * np.power(temp, 3)
-              }.get(type, lambda temp: -1)(tempr)
+    if type == 'e':
+        rtnval = pconst.sigmae * tempr ** 4
+    elif type == 'q':
+        rtnval = pconst.sigmaq * tempr ** 3
+    else:
+        rtnval = -1
     return rtnval
 
 
@@ -625,7 +940,7 @@ dplancktype = {'el' : dplnckel, 'ef' : dplnckef, 'en' : dplncken, \
 
 ################################################################
 ##
-def planck(spectral, temperature, type='el'):
+def planck(spectral, temperature, type='el', dtype=None):
     """Planck law spectral exitance.
 
     Calculates the Planck law spectral exitance from a surface at the stated 
@@ -641,6 +956,7 @@ def planck(spectral, temperature, type='el'):
         |  'l' signifies wavelength spectral vector  [micrometer].
         |  'n' signifies wavenumber spectral vector [cm-1].
         |  'f' signifies frequency spectral vecor [Hz].
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
 
     Returns:
         | (scalar, np.array[N,M]):  spectral radiant exitance (not radiance) in units selected.
@@ -654,7 +970,7 @@ def planck(spectral, temperature, type='el'):
     """
     if type in list(plancktype.keys()):
         #select the appropriate fn as requested by user
-        exitance = plancktype[type](spectral, temperature)
+        exitance = plancktype[type](spectral, temperature, dtype)
     else:
         # return all minus one if illegal type
         exitance = None
@@ -664,7 +980,7 @@ def planck(spectral, temperature, type='el'):
 
 ################################################################
 ##
-def dplanck(spectral, temperature, type='el'):
+def dplanck(spectral, temperature, type='el', dtype=None):
     """Temperature derivative of Planck law exitance.
 
     Calculates the temperature derivative for Planck law spectral exitance
@@ -681,6 +997,7 @@ def dplanck(spectral, temperature, type='el'):
         |  'l' signifies wavelength spectral vector  [micrometer].
         |  'n' signifies wavenumber spectral vector [cm-1].
         |  'f' signifies frequency spectral vecor [Hz].
+        | dtype (np.dtype): precision np.float64 (default) or np.float32
 
     Returns:
         | (scalar, np.array[N,M]):  spectral radiant exitance (not radiance) in units selected.
@@ -695,7 +1012,7 @@ def dplanck(spectral, temperature, type='el'):
 
     if type in list(dplancktype.keys()):
         #select the appropriate fn as requested by user
-        exitance = dplancktype[type](spectral, temperature)
+        exitance = dplancktype[type](spectral, temperature, dtype)
     else:
         # return all zeros if illegal type
         exitance = - np.ones(spectral.shape)
@@ -1089,6 +1406,41 @@ if __name__ == '__main__':
         print(exitancewRef/exitance)
         print('spectral variable converted: wn->nf->fw against original')
         print(wavelenRef/wavel)
+        print(' ')
+
+    if doAll:
+        #--------------------------------------------------------------------------------------
+        # test planckel_arr layout, single precision and the evaluation backends
+        M = planckel_arr(np.linspace(1.0, 2.0, 5), 300)
+        print('planckel_arr spectral (5,) & scalar temperature, output shape is {}, C contiguous {}'.format(
+            rit(M.shape), M.flags['C_CONTIGUOUS']))
+
+        # edge inputs: zero spectral, zero temperature and the Wien tail,
+        # where the exponent x=c2/(wl T) runs through the explimit cut-off
+        xWien = np.asarray([680., 700., 709., 709.9, 720.])
+        tmprtr = np.asarray([0., 20., 300.])
+        spectral = {'l': np.hstack((0., pconst.c2l / (xWien * 20), 1., 10.)),
+                    'n': np.hstack((0., xWien * 20 / pconst.c2n, 1000.)),
+                    'f': np.hstack((0., xWien * 20 / pconst.c2f, 3e13))}
+        functions = [planckel, planckef, plancken, planckql, planckqf, planckqn,
+                     dplnckel, dplnckef, dplncken, dplnckql, dplnckqf, dplnckqn]
+
+        print('float32 against float64 at the edge inputs, the following should print True:')
+        for fun in functions:
+            M = fun(spectral[fun.__name__[-1]], tmprtr)
+            M32 = fun(spectral[fun.__name__[-1]], tmprtr, dtype=np.float32)
+            print('{} {}'.format(fun.__name__, np.allclose(M32, M, rtol=1e-5, atol=1e-30, equal_nan=True)))
+
+        # evaluate with numba, numexpr and numpy in turn, by hiding the faster options
+        results = {}
+        numbaMod, neMod = numba, ne
+        for name, numba, ne in [('numba', numbaMod, neMod), ('numexpr', None, neMod), ('numpy', None, None)]:
+            results[name] = [fun(spectral[fun.__name__[-1]], tmprtr) for fun in functions]
+        numba, ne = numbaMod, neMod
+        print('numba and numexpr against numpy at the edge inputs, the following should print True:')
+        for name in ['numba', 'numexpr']:
+            print('{} {}'.format(name, all(np.allclose(M, Mnp, rtol=1e-9, atol=0, equal_nan=True)
+                for M, Mnp in zip(results[name], results['numpy']))))
 
 
     #--------------------------------------------------------------------------------------